@@ -0,0 +1,115 @@
+// 运行在内层工作流页面里的桥接脚本：
+// 1) 用服务端下发的 state 覆盖 localStorage 里的本地副本并刷新 UI
+// 2) 把 state 变化上报给组件宿主（index.html），由它 setComponentValue 交还 Python
+(function () {
+  try {
+    if (window.__BOOT_STATE__) {
+      state = window.__BOOT_STATE__;
+      if (typeof renderTable === 'function') renderTable();
+      if (typeof updateUIStatus === 'function') updateUIStatus();
+    }
+  } catch (e) {}
+
+  // 初始化“任务工时”全局计时器字段（不绑定某个任务）
+  try {
+    if (typeof state.workSeconds === 'undefined' || state.workSeconds === null) state.workSeconds = 0;
+    if (typeof state.lastWorkTimestamp === 'undefined') state.lastWorkTimestamp = null;
+  } catch (e) {}
+
+  // 心跳退避状态（用户操作时在 __wrap 里复位）
+  let __idleMult = 1;
+  let __idleTicks = 0;
+
+  function triggerStreamlitSync() {
+    try {
+      window.parent.postMessage({ type: 'workflow:state', json: JSON.stringify(state) }, '*');
+    } catch (e) {}
+  }
+  window.triggerStreamlitSync = triggerStreamlitSync;
+
+  // rAF 合并：同一帧内的多次 saveState 只做一次整棵 state 的 JSON.stringify；
+  // rev 计数器没前进就不重复 postMessage（大历史记录时序列化是 O(n) 的）
+  const __origSaveState = (typeof saveState === 'function') ? saveState : null;
+  let __savePending = false;
+  let __lastSentRev = 0;
+  window.saveState = function () {
+    state.rev = (state.rev || 0) + 1;
+    if (__savePending) return;
+    __savePending = true;
+    requestAnimationFrame(() => {
+      __savePending = false;
+      try { if (__origSaveState) __origSaveState(); } catch (e) {}
+      try {
+        const nameInput = document.getElementById('userNameInput');
+        if (nameInput) state.userName = nameInput.value;
+        localStorage.setItem('perf_v46_state', JSON.stringify(state));
+        // 触发 Streamlit 同步（仅当本帧确有新修改）
+        if (state.rev !== __lastSentRev) {
+          __lastSentRev = state.rev;
+          triggerStreamlitSync();
+        }
+      } catch (e) {}
+    });
+  };
+
+  function __wrap(fnName) {
+    try {
+      const fn = window[fnName];
+      if (typeof fn !== 'function') return;
+      window[fnName] = function () {
+        const ret = fn.apply(this, arguments);
+        // 操作后触发同步，并把心跳退避复位（用户回来干活了）
+        __idleMult = 1;
+        __idleTicks = 0;
+        try { triggerStreamlitSync(); } catch (e) {}
+        return ret;
+      };
+    } catch (e) {}
+  }
+  ['toggleClock', 'toggleMeeting', 'toggleRest', 'toggleTask', 'completeTask', 'reopen', 'confirmAddTask', 'addSolu'].forEach(__wrap);
+
+  // 额外监控：当特定DOM元素发生变化时也触发（针对非函数调用的场景，如拖拽）
+  try {
+    const observer = new MutationObserver(() => {
+      // 简单防抖，避免频繁触发
+      if (window.__syncTimeout) clearTimeout(window.__syncTimeout);
+      window.__syncTimeout = setTimeout(triggerStreamlitSync, 800);
+    });
+    const taskBody = document.getElementById('taskBody');
+    if (taskBody) observer.observe(taskBody, { childList: true, subtree: true, characterData: true });
+  } catch (e) {}
+
+  // 高度自适应：内容多高 iframe 就多高，避免固定 950px 的空白绘制/嵌套滚动条
+  try {
+    new ResizeObserver(() => {
+      try {
+        window.parent.postMessage({ type: 'workflow:height', height: document.body.scrollHeight }, '*');
+      } catch (e) {}
+    }).observe(document.body);
+  } catch (e) {}
+
+  // 心跳：基础 2 秒一拍，state 没变化就指数退避（2s → 4s → 8s → 最慢 30s），
+  // 任何用户操作（__wrap 处复位）立即回到 2s。挂机时心跳量降一个数量级，
+  // 下游的 Streamlit 重跑 / SQLite 写入也跟着省掉
+  function __hashState() {
+    try {
+      return JSON.stringify(state).length + ':' + ((state.tasks || []).length);
+    } catch (e) {
+      return '';
+    }
+  }
+  let __lastHash = null;
+  setInterval(() => {
+    __idleTicks += 1;
+    if (__idleTicks % __idleMult !== 0) return;
+    const h = __hashState();
+    if (h === __lastHash) {
+      __idleMult = Math.min(__idleMult * 2, 15); // 15 拍 ≈ 30 秒
+    } else {
+      __lastHash = h;
+      __idleMult = 1;
+    }
+    triggerStreamlitSync();
+  }, 2000);
+  setTimeout(triggerStreamlitSync, 2000);
+})();
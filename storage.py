@@ -0,0 +1,42 @@
+"""state_json 的压缩存取（streamlit_app 与 sync_server 共用）。
+
+state_json 会随任务/考勤/会议历史无限增长，明文入库既占磁盘也拖慢读取。
+JSON 压缩率通常有 5-10 倍：优先用 zstandard（若已安装），否则退回标准库 zlib，
+避免引入硬依赖。读取时按魔数自动识别格式，旧的未压缩文本行原样返回。
+"""
+
+import zlib
+from typing import Optional, Union
+
+try:
+    import zstandard as _zstd
+    _cctx = _zstd.ZstdCompressor(level=3)
+    _dctx = _zstd.ZstdDecompressor()
+except ImportError:
+    _zstd = None
+
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def compress_state(state_json: str) -> bytes:
+    raw = state_json.encode("utf-8")
+    if _zstd is not None:
+        return _cctx.compress(raw)
+    return zlib.compress(raw, 6)
+
+
+def decompress_state(blob: Optional[Union[str, bytes]]) -> Optional[str]:
+    if blob is None:
+        return None
+    if isinstance(blob, str):
+        # 旧行：未压缩的 JSON 文本
+        return blob
+    b = bytes(blob)
+    if b.startswith(_ZSTD_MAGIC):
+        if _zstd is None:
+            raise RuntimeError("state_json 是 zstd 压缩的，但未安装 zstandard")
+        return _dctx.decompress(b).decode("utf-8")
+    if b[:1] == b"\x78":
+        return zlib.decompress(b).decode("utf-8")
+    # 兜底：当作未压缩字节
+    return b.decode("utf-8")
@@ -1,13 +1,33 @@
 import streamlit as st
 import streamlit.components.v1 as components
+import hashlib
+import hmac
 import sqlite3
 import json
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
+import bisect
+import functools
+import heapq
+import itertools
+import operator
+import threading
 import time
 from typing import Optional, Union
 
+from storage import compress_state, decompress_state
+
+# state blob 能到几十上百 KB，管理员每次轮询都要 loads 一遍；
+# orjson（C 实现）比标准库快数倍，装了就用，没装退回 json，不加硬依赖
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+_json_loads = _orjson.loads if _orjson is not None else json.loads
+
 # --- 原始 HTML 加载（必须在 get_html_content() 使用前定义） ---
 # 优先从同目录下的 HTML 文件读取，避免 USER_ORIGINAL_HTML 未定义导致运行时错误。
 _html_path = Path(__file__).with_name("工作流工作记录分析系统 - V46.html")
@@ -25,33 +45,55 @@ except Exception as e:
 </html>
 """
 
+# 预计算注入点：模板是常量，</head>/</body> 的位置只需要找一次；
+# 每次组装直接切片拼接，省掉 _inject_before_tag 里两遍全文 lower() 扫描
+_tpl_lower = USER_ORIGINAL_HTML.lower()
+_HEAD_IDX = _tpl_lower.find("</head>")
+_BODY_IDX = _tpl_lower.find("</body>")
+if 0 <= _HEAD_IDX <= _BODY_IDX:
+    _HEAD_PREFIX = USER_ORIGINAL_HTML[:_HEAD_IDX]
+    _HEAD_SUFFIX = USER_ORIGINAL_HTML[_HEAD_IDX:_BODY_IDX]
+    _BODY_SUFFIX = USER_ORIGINAL_HTML[_BODY_IDX:]
+else:
+    # 模板异常（如加载失败的兜底页）：全部当作前缀，注入内容追加在尾部
+    _HEAD_PREFIX, _HEAD_SUFFIX, _BODY_SUFFIX = USER_ORIGINAL_HTML, "", ""
+del _tpl_lower
+
+
 def _safe_json_loads(s: Optional[str]) -> dict:
     if not s:
         return {}
     try:
-        return json.loads(s)
+        return _json_loads(s)
     except Exception:
         return {}
 
 
 def _format_hhmmss(seconds: Union[float, int]) -> str:
-    try:
-        s = int(max(0, seconds))
-    except Exception:
-        s = 0
-    h = s // 3600
-    m = (s % 3600) // 60
-    ss = s % 60
+    # isinstance 快路径：正常调用都是数值，异常兜底只留给脏数据，
+    # divmod 一次算商和余数，省掉重复除法
+    if isinstance(seconds, (int, float)):
+        s = int(seconds) if seconds > 0 else 0
+    else:
+        try:
+            s = int(max(0, seconds))
+        except Exception:
+            s = 0
+    h, rem = divmod(s, 3600)
+    m, ss = divmod(rem, 60)
     return f"{h:02d}:{m:02d}:{ss:02d}"
 
 
 def _format_hhmm(seconds: Union[float, int]) -> str:
-    try:
-        s = int(max(0, seconds))
-    except Exception:
-        s = 0
-    h = s // 3600
-    m = (s % 3600) // 60
+    if isinstance(seconds, (int, float)):
+        s = int(seconds) if seconds > 0 else 0
+    else:
+        try:
+            s = int(max(0, seconds))
+        except Exception:
+            s = 0
+    h, rem = divmod(s, 3600)
+    m = rem // 60
     return f"{h:02d}:{m:02d}"
 
 
@@ -117,13 +159,13 @@ def _compute_admin_status(state: dict) -> dict:
     else:
         mode = "空闲"
 
-    # “正在执行：xxx”（对齐原 HTML 巨幕状态）
+    # “正在执行：xxx”（对齐原 HTML 巨幕状态）——用 id 索引做 O(1) 查找，避免每次刷新线性扫任务列表
     active_task_name = ""
     if active_id:
-        for t in state.get("tasks", []):
-            if str(t.get("id")) == str(active_id):
-                active_task_name = str(t.get("name") or "")
-                break
+        task_by_id = {str(t.get("id")): t for t in (state.get("tasks") or [])}
+        active_task = task_by_id.get(str(active_id))
+        if active_task is not None:
+            active_task_name = str(active_task.get("name") or "")
 
     if not is_clocked:
         giant = "待机中"
@@ -193,167 +235,328 @@ def _compute_admin_status(state: dict) -> dict:
     }
 
 
+def _hist_entry(h: dict, now_ms: int, running: bool):
+    """三类历史（任务/会议/休息）共用的时长解析：返回 (startMs, 结束文本, 时长文本)。
+
+    startMs 缺失返回 None（调用方跳过该条）；进行中条目按 now_ms 推算实时时长。
+    """
+    start_ms = h.get("startMs")
+    if start_ms is None:
+        return None
+    end = h.get("end")
+    dur = h.get("duration")
+    if dur is None and running and not end:
+        dur = max(0.0, (now_ms - int(start_ms)) / 1000.0)
+    return (
+        int(start_ms),
+        end or "进行中",
+        _format_hhmm(dur) if dur and dur > 0 else "--",
+    )
+
+
 def _build_admin_tables(state: dict, employee_username: str) -> dict:
     # 表格一：任务汇总
-    tasks_rows = []
+    # dict-of-lists 直接给 pd.DataFrame：跳过 list-of-dicts 路径的逐行 schema 推断
+    t_name, t_status, t_created, t_est, t_done, t_spent, t_dev = [], [], [], [], [], [], []
     for t in state.get("tasks", []):
-        spent = float(t.get("spentSeconds") or 0)
-        tasks_rows.append(
-            {
-                "任务名称": t.get("name") or "",
-                "状态": "已完成" if t.get("completed") else "进行中",
-                "制定日期": t.get("createdAt") or "--",
-                "预计(h)": t.get("estTime") or "",
-                "完成日期": t.get("completedAt") or "--",
-                "总耗时": _format_hhmm(spent),
-                "产出证明": (t.get("dev") or "").strip(),
-            }
-        )
+        t_name.append(t.get("name") or "")
+        t_status.append("已完成" if t.get("completed") else "进行中")
+        t_created.append(t.get("createdAt") or "--")
+        t_est.append(str(t.get("estTime") or ""))
+        t_done.append(t.get("completedAt") or "--")
+        t_spent.append(_format_hhmm(float(t.get("spentSeconds") or 0)))
+        t_dev.append((t.get("dev") or "").strip())
+    # 显式 string dtype：跳过 pandas 的逐列类型推断，Arrow 序列化也不用再猜 object 列
+    tasks_df = pd.DataFrame(
+        {
+            "任务名称": pd.array(t_name, dtype="string"),
+            "状态": pd.array(t_status, dtype="string"),
+            "制定日期": pd.array(t_created, dtype="string"),
+            "预计(h)": pd.array(t_est, dtype="string"),
+            "完成日期": pd.array(t_done, dtype="string"),
+            "总耗时": pd.array(t_spent, dtype="string"),
+            "产出证明": pd.array(t_dev, dtype="string"),
+        }
+    )
 
     # 表格二：工时统计
-    att_rows = []
-    for a in state.get("attendance", []):
-        task_total = float(a.get("taskTotal") or 0)
-        meeting = float(a.get("meeting") or 0)
-        rest = float(a.get("rest") or 0)
-        total_clocked = float(a.get("totalClocked") or 0)
-        other = max(0.0, total_clocked - task_total - meeting - rest)
-        att_rows.append(
-            {
-                "日期": a.get("date") or "",
-                "上班打卡": a.get("clockIn") or "",
-                "下班打卡": a.get("clockOut") or "",
-                "任务总长": _format_hhmm(task_total),
-                "会议总长": _format_hhmm(meeting),
-                "休息总长": _format_hhmm(rest),
-                "其他碎型": _format_hhmm(other),
-            }
-        )
+    # 数值部分抽成 NumPy 数组做向量化：减法和 0 截断在 C 层一次算完，
+    # 解释器里只剩字段提取和最终的 HH:MM 格式化
+    attendance = state.get("attendance", [])
+    n_att = len(attendance)
+    a_date, a_in, a_out = [], [], []
+    task_total = np.empty(n_att)
+    meeting = np.empty(n_att)
+    rest = np.empty(n_att)
+    total_clocked = np.empty(n_att)
+    for i, a in enumerate(attendance):
+        a_date.append(a.get("date") or "")
+        a_in.append(a.get("clockIn") or "")
+        a_out.append(a.get("clockOut") or "")
+        task_total[i] = float(a.get("taskTotal") or 0)
+        meeting[i] = float(a.get("meeting") or 0)
+        rest[i] = float(a.get("rest") or 0)
+        total_clocked[i] = float(a.get("totalClocked") or 0)
+    other = np.maximum(total_clocked - task_total - meeting - rest, 0.0)
+    a_task = [_format_hhmm(v) for v in task_total.tolist()]
+    a_meet = [_format_hhmm(v) for v in meeting.tolist()]
+    a_rest = [_format_hhmm(v) for v in rest.tolist()]
+    a_other = [_format_hhmm(v) for v in other.tolist()]
+    att_df = pd.DataFrame(
+        {
+            "日期": pd.array(a_date, dtype="string"),
+            "上班打卡": pd.array(a_in, dtype="string"),
+            "下班打卡": pd.array(a_out, dtype="string"),
+            "任务总长": pd.array(a_task, dtype="string"),
+            "会议总长": pd.array(a_meet, dtype="string"),
+            "休息总长": pd.array(a_rest, dtype="string"),
+            "其他碎型": pd.array(a_other, dtype="string"),
+        }
+    )
 
     # 表格三：全流水详细审计日志
+    # 三个来源（任务历史/会议/休息）各自按发生顺序追加，基本天然有序：
+    # 用 heapq.merge 做 O(N) 的有序归并，替代对全量行的 O(N log N) 排序。
+    # 打卡行通常在头/尾，但任务历史是跨天留存的：早于今天上班打卡的条目很常见，
+    # 所以打卡行只有确认有序时才直接挂头/尾，否则二分插回正确位置。
     now_ms = int(time.time() * 1000)
-    logs = []
-    if state.get("clockInFullMs"):
-        logs.append(
-            {
-                "ms": int(state["clockInFullMs"]),
-                "动作名称": "【上班打卡】",
-                "关联内容": "--",
-                "开始时间": state.get("clockInTime") or "--",
-                "结束时间": "--",
-                "时长": "--",
-                "详细记录": "",
-            }
-        )
+    task_rows: list = []
+    meeting_rows: list = []
+    rest_rows: list = []
 
-    active_id = state.get("activeTaskId")
+    # 循环外绑定：状态标志、任务名等在整个循环期间不变，
+    # 提前取成局部变量，内层每行少做几次 dict 方法查找
+    active_id_s = str(state.get("activeTaskId")) if state.get("activeTaskId") else None
+    is_meeting = bool(state.get("isMeeting"))
+    is_resting = bool(state.get("isResting"))
     for t in state.get("tasks", []):
+        # 每个任务只做一次 str() 归一化，而不是在最内层 history 循环里反复转
+        is_active_task = active_id_s is not None and str(t.get("id")) == active_id_s
+        t_name = t.get("name") or ""
         for s in (t.get("solutions") or []):
+            s_related = f"{t_name}-{s.get('text') or ''}"
+            s_note = (s.get("researchNote") or "").strip()
             for h in (s.get("history") or []):
-                start_ms = h.get("startMs")
-                if start_ms is None:
+                entry = _hist_entry(h, now_ms, is_active_task)
+                if entry is None:
                     continue
-                end = h.get("end")
-                dur = h.get("duration")
-                if dur is None and str(active_id) == str(t.get("id")) and not end:
-                    dur = max(0.0, (now_ms - int(start_ms)) / 1000.0)
-                logs.append(
-                    {
-                        "ms": int(start_ms),
-                        "动作名称": "任务执行",
-                        "关联内容": f"{t.get('name','')}-{s.get('text','')}",
-                        "开始时间": h.get("start") or "",
-                        "结束时间": end or "进行中",
-                        "时长": _format_hhmm(dur) if dur and dur > 0 else "--",
-                        "详细记录": (s.get("researchNote") or "").strip(),
-                    }
-                )
+                task_rows.append((entry[0], "任务执行", s_related, h.get("start") or "", entry[1], entry[2], s_note))
 
     for h in state.get("meetingHistory", []):
-        start_ms = h.get("startMs")
-        if start_ms is None:
+        entry = _hist_entry(h, now_ms, is_meeting)
+        if entry is None:
             continue
-        end = h.get("end")
-        dur = h.get("duration")
-        if dur is None and state.get("isMeeting") and not end:
-            dur = max(0.0, (now_ms - int(start_ms)) / 1000.0)
-        logs.append(
-            {
-                "ms": int(start_ms),
-                "动作名称": "会议沟通",
-                "关联内容": "内部沟通",
-                "开始时间": h.get("start") or "",
-                "结束时间": end or "进行中",
-                "时长": _format_hhmm(dur) if dur and dur > 0 else "--",
-                "详细记录": "",
-            }
-        )
+        meeting_rows.append((entry[0], "会议沟通", "内部沟通", h.get("start") or "", entry[1], entry[2], ""))
 
     for h in state.get("restHistory", []):
-        start_ms = h.get("startMs")
-        if start_ms is None:
+        entry = _hist_entry(h, now_ms, is_resting)
+        if entry is None:
             continue
-        end = h.get("end")
-        dur = h.get("duration")
-        if dur is None and state.get("isResting") and not end:
-            dur = max(0.0, (now_ms - int(start_ms)) / 1000.0)
-        logs.append(
-            {
-                "ms": int(start_ms),
-                "动作名称": "休息午休",
-                "关联内容": "--",
-                "开始时间": h.get("start") or "",
-                "结束时间": end or "进行中",
-                "时长": _format_hhmm(dur) if dur and dur > 0 else "--",
-                "详细记录": "",
-            }
-        )
+        rest_rows.append((entry[0], "休息午休", "--", h.get("start") or "", entry[1], entry[2], ""))
+
+    # 任务流跨任务/方案拼接后可能失序（其余两个来源是 append-only 的）；
+    # 只在确实乱序时排序——timsort 对近有序序列接近 O(N)
+    _ms_key = operator.itemgetter(0)
+    for rows in (task_rows, meeting_rows, rest_rows):
+        if any(rows[i][0] > rows[i + 1][0] for i in range(len(rows) - 1)):
+            rows.sort(key=_ms_key)
+
+    merged: list = list(heapq.merge(task_rows, meeting_rows, rest_rows, key=_ms_key))
+    if state.get("clockInFullMs"):
+        row = (int(state["clockInFullMs"]), "【上班打卡】", "--", state.get("clockInTime") or "--", "--", "--", "")
+        if not merged or row[0] <= merged[0][0]:
+            merged.insert(0, row)
+        else:
+            bisect.insort(merged, row, key=_ms_key)
 
     # 下班打卡（如果已下班，取最后一条考勤）
     if not state.get("isClockedIn") and state.get("attendance"):
         last_att = state["attendance"][-1]
         if last_att.get("clockOutFullMs"):
-            logs.append(
-                {
-                    "ms": int(last_att["clockOutFullMs"]),
-                    "动作名称": "【下班打卡】",
-                    "关联内容": "--",
-                    "开始时间": last_att.get("clockOut") or "--",
-                    "结束时间": "--",
-                    "时长": "--",
-                    "详细记录": "",
-                }
-            )
+            row = (int(last_att["clockOutFullMs"]), "【下班打卡】", "--", last_att.get("clockOut") or "--", "--", "--", "")
+            if not merged or row[0] >= merged[-1][0]:
+                merged.append(row)
+            else:
+                bisect.insort(merged, row, key=_ms_key)
 
-    logs = sorted(logs, key=lambda x: x.get("ms", 0))
-    for row in logs:
-        row.pop("ms", None)
+    if merged:
+        _, log_action, log_related, log_start, log_end, log_dur, log_note = zip(*merged)
+    else:
+        log_action = log_related = log_start = log_end = log_dur = log_note = ()
+    logs_df = pd.DataFrame(
+        {
+            "动作名称": pd.array(log_action, dtype="string"),
+            "关联内容": pd.array(log_related, dtype="string"),
+            "开始时间": pd.array(log_start, dtype="string"),
+            "结束时间": pd.array(log_end, dtype="string"),
+            "时长": pd.array(log_dur, dtype="string"),
+            "详细记录": pd.array(log_note, dtype="string"),
+        }
+    )
 
     return {
-        "tasks": pd.DataFrame(tasks_rows),
-        "attendance": pd.DataFrame(att_rows),
-        "logs": pd.DataFrame(logs),
+        "tasks": tasks_df,
+        "attendance": att_df,
+        "logs": logs_df,
     }
 
+# --- 口令散列：库里只存加盐 hash，登录时在 Python 侧 compare_digest 比较 ---
+_PWD_SALT = b"workflow-system-v46"
+
+def _hash_pwd(pwd: str) -> bytes:
+    return hashlib.blake2b(pwd.encode("utf-8"), key=_PWD_SALT, digest_size=16).digest()
+
+
 # --- 数据库初始化 ---
+# cache_resource: Streamlit 每次交互都会整体重跑脚本，建表/种子语句只需在进程启动后执行一次
+@st.cache_resource
 def init_db():
     conn = sqlite3.connect('workflow_system.db')
     c = conn.cursor()
     # 用户表: username, password, role (admin/employee)
-    c.execute('''CREATE TABLE IF NOT EXISTS users 
+    c.execute('''CREATE TABLE IF NOT EXISTS users
                  (username TEXT PRIMARY KEY, password TEXT, role TEXT)''')
     # 数据表: username, state_json (存储工作流的所有数据)
-    c.execute('''CREATE TABLE IF NOT EXISTS user_data 
-                 (username TEXT PRIMARY KEY, state_json TEXT, last_updated TIMESTAMP)''')
-    
+    # state_json 存压缩后的 BLOB（见 storage.py）；last_updated 存 Unix 秒（INTEGER）
+    c.execute('''CREATE TABLE IF NOT EXISTS user_data
+                 (username TEXT PRIMARY KEY, state_json BLOB, last_updated INTEGER)''')
+
+    # 迁移：补 pwd_hash 列，并把历史明文口令换成加盐 hash
+    try:
+        c.execute("ALTER TABLE users ADD COLUMN pwd_hash BLOB")
+    except sqlite3.OperationalError:
+        pass  # 列已存在
+    legacy = c.execute(
+        "SELECT username, password FROM users WHERE pwd_hash IS NULL AND password != ''"
+    ).fetchall()
+    for username, password in legacy:
+        c.execute(
+            "UPDATE users SET pwd_hash=?, password='' WHERE username=?",
+            (_hash_pwd(password), username),
+        )
+
+    # 覆盖索引：登录 SELECT role, pwd_hash WHERE username=? 可以只走索引不回表
+    c.execute("DROP INDEX IF EXISTS idx_users_login")
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_users_login
+                 ON users(username, pwd_hash, role)''')
+
     # 创建默认管理员 (如果不存在)，并确保默认密码为 admin
-    c.execute("INSERT OR IGNORE INTO users VALUES ('admin', 'admin', 'admin')")
-    c.execute("UPDATE users SET password='admin', role='admin' WHERE username='admin'")
+    # 先查再改：每次冷启动都无条件 UPDATE 会白白弄脏页面并多一次 fsync
+    admin_hash = _hash_pwd('admin')
+    c.execute("INSERT OR IGNORE INTO users VALUES ('admin', '', 'admin', ?)", (admin_hash,))
+    row = c.execute("SELECT password, role, pwd_hash FROM users WHERE username='admin'").fetchone()
+    if row != ('', 'admin', admin_hash):
+        c.execute("UPDATE users SET pwd_hash=?, password='', role='admin' WHERE username='admin'", (admin_hash,))
+    c.execute("ANALYZE")
     conn.commit()
     conn.close()
+    return True
+
+# 长连接复用：避免每次重跑都 connect/close（丢失 SQLite 热页缓存，且多付 ~200µs 系统调用）
+# 读写分离：WAL 下写连接独占写锁时，mode=ro 的读连接不会被阻塞（登录/管理员看板不等保存）
+@st.cache_resource
+def writer():
+    c = sqlite3.connect('file:workflow_system.db?mode=rwc', uri=True, check_same_thread=False,
+                        isolation_level=None, cached_statements=128)
+    c.execute('PRAGMA journal_mode=WAL')
+    c.execute('PRAGMA synchronous=NORMAL')
+    c.execute('PRAGMA temp_store=MEMORY')
+    c.execute('PRAGMA cache_size=-20000')
+    return c
+
+@st.cache_resource
+def reader_pool():
+    return [
+        sqlite3.connect('file:workflow_system.db?mode=ro&cache=private', uri=True, check_same_thread=False,
+                        cached_statements=128)
+        for _ in range(4)
+    ]
+
+@st.cache_resource
+def _reader_cycle():
+    return itertools.cycle(reader_pool())
+
+def reader():
+    return next(_reader_cycle())
+
+# 热路径 SQL 常量：每次 execute 传同一个字符串对象，SQLite 连接内置的
+# prepared-statement 缓存（默认 ~100 条）才能命中，省掉重复 parse/plan
+SQL_LOGIN = "SELECT role, pwd_hash FROM users WHERE username=?"
+SQL_STATE_VERSION = "SELECT last_updated FROM user_data WHERE username=?"
+SQL_LOAD_STATE = "SELECT state_json FROM user_data WHERE username=?"
+SQL_EMPLOYEES = "SELECT username FROM users WHERE role='employee'"
+SQL_UPSERT_STATE = (
+    "INSERT INTO user_data(username, state_json, last_updated) VALUES(?, ?, ?) "
+    "ON CONFLICT(username) DO UPDATE SET state_json=excluded.state_json, last_updated=excluded.last_updated"
+)
 
-def get_db_connection():
-    return sqlite3.connect('workflow_system.db')
+# 员工名单很少变化：短 TTL 缓存，避免每次重跑都查询 + 为一个下拉框构造 DataFrame
+@st.cache_data(ttl=30, show_spinner=False)
+def _employee_list():
+    cur = reader().execute(SQL_EMPLOYEES)
+    return [r[0] for r in cur]
+
+# 状态加载缓存：last_updated 作为版本号进缓存 key，
+# 没有新保存时的重复重跑直接命中进程内缓存，完全不碰 SQLite
+def _state_version(username: str):
+    row = reader().execute(SQL_STATE_VERSION, (username,)).fetchone()
+    return row[0] if row else None
+
+@st.cache_data(ttl=30, show_spinner=False)
+def load_state(username: str, version) -> Optional[str]:
+    row = reader().execute(SQL_LOAD_STATE, (username,)).fetchone()
+    return decompress_state(row[0]) if row else None
+
+# 三表缓存：轮询时员工多数时间没有新保存，version 不变就直接还缓存里的 DataFrame，
+# 整个解析 + 循环 + DataFrame 构建全跳过。短 TTL 让“进行中”条目的时长仍会推进。
+@st.cache_data(ttl=10, show_spinner=False)
+def _cached_admin_tables(username: str, version, state_json: Optional[str]) -> dict:
+    return _build_admin_tables(_load_state_from_db(state_json, username), username)
+
+# --- 写合并：自动同步会产生大量小保存，合并成一笔事务落盘，省掉每行一次的 fsync ---
+_pending: dict = {}
+_pending_lock = threading.Lock()
+_flush_timer: Optional[threading.Timer] = None
+
+def _flush_pending(conn):
+    global _flush_timer
+    with _pending_lock:
+        items = list(_pending.items())
+        _pending.clear()
+        _flush_timer = None
+    if not items:
+        return
+    now = int(time.time())
+    rows = [(u, compress_state(s), now) for u, s in items]
+    try:
+        conn.execute("BEGIN")
+        conn.executemany(SQL_UPSERT_STATE, rows)
+        conn.execute("COMMIT")
+    except sqlite3.Error:
+        # 失败（如 SQLITE_BUSY）不能丢保存：回滚让共享连接离开事务，
+        # 条目放回队列（不覆盖期间新到的更新版本）并再约一次冲刷重试
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+        with _pending_lock:
+            for u, s in items:
+                _pending.setdefault(u, s)
+            if _flush_timer is None:
+                _flush_timer = threading.Timer(0.5, _flush_pending, args=(conn,))
+                _flush_timer.daemon = True
+                _flush_timer.start()
+
+def _queue_state_write(username: str, state_json: str) -> None:
+    """半秒内同一用户的多次保存只落库一次（最后一次覆盖前面的）。"""
+    global _flush_timer
+    conn = writer()  # 在脚本线程里取连接，Timer 线程直接用
+    with _pending_lock:
+        _pending[username] = state_json
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(0.5, _flush_pending, args=(conn,))
+            _flush_timer.daemon = True
+            _flush_timer.start()
 
 # --- HTML 注入工具：把 CSS/JS 插到正确的位置（避免把脚本拼在 </html> 之后导致不执行/不稳定） ---
 def _inject_before_tag(html: str, tag: str, insertion: str) -> str:
@@ -363,44 +566,37 @@ def _inject_before_tag(html: str, tag: str, insertion: str) -> str:
     """
     if not html:
         return insertion
-    lower = html.lower()
-    idx = lower.find(tag.lower())
+    # 快路径：模板里的闭合标签都是小写的，直接 find 命中就不用造整页的 lower() 副本
+    idx = html.find(tag)
+    if idx == -1:
+        idx = html.lower().find(tag.lower())
     if idx == -1:
         return html + insertion
     return html[:idx] + insertion + html[idx:]
 
 
+# 默认初始状态的 JSON 只有 userName 一个变量，其余全是常量：
+# 模板化后每次渲染只需编码一个短字符串，不再走完整的 dict + json.dumps
+_DEFAULT_STATE_TEMPLATE = (
+    '{"tasks": [], "attendance": [], "activeTaskId": null, '
+    '"isClockedIn": false, "isMeeting": false, "isResting": false, '
+    '"meetingSeconds": 0, "restSeconds": 0, '
+    '"meetingHistory": [], "restHistory": [], '
+    '"clockInTime": null, "clockInFullMs": null, "userName": %s}'
+)
+
+@functools.lru_cache(maxsize=256)
+def _default_state_json(user_display_name: str) -> str:
+    return _DEFAULT_STATE_TEMPLATE % json.dumps(user_display_name)
+
+
 # --- 核心 HTML 模板逻辑 ---
 # 这里我们将你提供的 HTML 包装成一个函数，并根据角色动态修改
-def get_html_content(
-    user_state_json,
-    is_admin=False,
-    user_display_name="",
-    hide_export: bool = False,
-    readonly: bool = False,
-    enable_sync: bool = True,
-):
-    # 如果数据库里没数据，使用默认初始状态
-    if not user_state_json:
-        user_state_json = json.dumps({
-            "tasks": [], "attendance": [], "activeTaskId": None,
-            "isClockedIn": False, "isMeeting": False, "isResting": False,
-            "meetingSeconds": 0, "restSeconds": 0,
-            "meetingHistory": [], "restHistory": [],
-            "clockInTime": None, "clockInFullMs": None, "userName": user_display_name
-        })
-
-    # 注入一部分 JS 代码，用于将数据传回 Streamlit
-    # 并且根据角色隐藏导出按钮
-    hide_export_css = ""
-    if hide_export or (not is_admin):
-        hide_export_css = "<style>.btn-large[onclick='exportToCSV()'] { display: none !important; }</style>"
-
-    readonly_css = ""
-    if readonly:
-        # 只读投射：禁用编辑/拖拽，并隐藏会改变状态/触发计时/导出/新增等按钮
-        readonly_css = """
-        <style>
+# 注入片段全部是常量：放到模块级，_build_skeleton 只做拼接选择，不再每次重建字符串
+_HIDE_EXPORT_CSS = "<style>.btn-large[onclick='exportToCSV()'] { display: none !important; }</style>"
+
+# 只读投射：禁用编辑/拖拽，并隐藏会改变状态/触发计时/导出/新增等按钮
+_READONLY_CSS = """        <style>
           /* 禁用所有可编辑区域 */
           [contenteditable="true"] { pointer-events: none !important; user-select: text !important; }
           .drag-handle { pointer-events: none !important; }
@@ -419,39 +615,31 @@ def get_html_content(
         </style>
         """
 
-    # 注入：员工侧把 state 同步到 Streamlit Session State
-    # 纯 Streamlit 模式：前端通过 input event 触发 Rerun
-    sync_js = ""
-    if enable_sync and (not readonly):
-        sync_js = "" # 之前占位，现在清空，逻辑全移到 js_inject 中
-
-
-    # 把 CSS 放到 </head> 前（若没有 head，则追加）
-    css_inject = f"{hide_export_css}\n{readonly_css}\n"
-    html = USER_ORIGINAL_HTML
-    html = _inject_before_tag(html, "</head>", css_inject)
-
-    # 移除手动复制按钮注入 (因为已经改为自动同步了)
-    # copy_state_js = ...
-    # copy_btn_html = ...
-    
-    # 把覆盖逻辑插到 </body> 前（确保脚本在文档内，且执行顺序可控）
-    js_inject = f"""
-{sync_js}
-<script>
+# 基础注入（所有角色）：state 覆盖 + 高度自适应。
+# __STATE_JSON__ 是占位符，组装时由真正的 state JSON 替换
+_BASE_JS = """<script>
   // 覆盖原始 state（来自 DB），并主动刷新 UI（兼容原脚本已运行的情况）
-  try {{
-    state = {user_state_json};
+  try {
+    state = __STATE_JSON__;
     if (typeof renderTable === 'function') renderTable();
     if (typeof updateUIStatus === 'function') updateUIStatus();
-  }} catch (e) {{}}
+  } catch (e) {}
+</script>
+<script>
+  // 高度自适应：把实际内容高度上报给 Streamlit，初始 height 只是兜底
+  try {
+    new ResizeObserver(() => {
+      window.parent.postMessage(
+        { isStreamlitMessage: true, type: "streamlit:setFrameHeight", height: document.body.scrollHeight },
+        "*"
+      );
+    }).observe(document.body);
+  } catch (e) {}
 </script>
 """
 
-    # 只有员工端才启用“强制同步”逻辑；管理员投射只读预览必须禁用，避免反向覆盖。
-    if enable_sync and (not readonly):
-        js_inject += """
-<script>
+# 员工端同步注入：管理员投射只读预览必须禁用，避免反向覆盖
+_SYNC_JS = """<script>
   // 初始化“任务工时”全局计时器字段（不绑定某个任务）
   try {
     if (typeof state.workSeconds === 'undefined' || state.workSeconds === null) state.workSeconds = 0;
@@ -463,16 +651,28 @@ def get_html_content(
   }
 
   const __origSaveState = (typeof saveState === 'function') ? saveState : null;
+  // rAF 合并：同一帧内的多次 saveState 只做一次整棵 state 的 JSON.stringify；
+  // rev 计数器没前进就不重复 postMessage（大历史记录时序列化是 O(n) 的）
+  let __savePending = false;
+  let __lastSentRev = 0;
   function saveState() {
-    try { if (__origSaveState) __origSaveState(); } catch (e) {}
-    try {
-      if (typeof document !== 'undefined' && document.getElementById('userNameInput')) {
-        state.userName = document.getElementById('userNameInput').value;
-      }
-      localStorage.setItem('perf_v46_state', JSON.stringify(state));
-      // 触发 Streamlit 同步
-      if (typeof triggerStreamlitSync === 'function') triggerStreamlitSync();
-    } catch (e) {}
+    state.rev = (state.rev || 0) + 1;
+    if (__savePending) return;
+    __savePending = true;
+    requestAnimationFrame(() => {
+      __savePending = false;
+      try { if (__origSaveState) __origSaveState(); } catch (e) {}
+      try {
+        const nameInput = document.getElementById('userNameInput');
+        if (nameInput) state.userName = nameInput.value;
+        localStorage.setItem('perf_v46_state', JSON.stringify(state));
+        // 触发 Streamlit 同步（仅当本帧确有新修改）
+        if (typeof triggerStreamlitSync === 'function' && state.rev !== __lastSentRev) {
+          __lastSentRev = state.rev;
+          triggerStreamlitSync();
+        }
+      } catch (e) {}
+    });
   }
 
   function __wrap(fnName) {
@@ -488,7 +688,7 @@ def get_html_content(
     } catch (e) {}
   }
   ['toggleClock','toggleMeeting','toggleRest','toggleTask','completeTask','reopen','confirmAddTask','addSolu'].forEach(__wrap);
-  
+
   // 额外监控：当特定DOM元素发生变化时也触发（针对非函数调用的场景，如拖拽）
   try {
     const observer = new MutationObserver((mutations) => {
@@ -503,8 +703,6 @@ def get_html_content(
     if (taskBody) observer.observe(taskBody, { childList: true, subtree: true, characterData: true });
   } catch(e) {}
 
-  } catch (e) {}
-
   try {
     document.addEventListener('visibilitychange', () => {
       if (document.visibilityState === 'hidden') __forceSyncNow();
@@ -513,8 +711,108 @@ def get_html_content(
   } catch (e) {}
 </script>
 """
-    html = _inject_before_tag(html, "</body>", js_inject)
-    return html
+
+
+# 骨架缓存：CSS/JS 只随 (is_admin, hide_export, readonly, enable_sync) 变化——
+# 一个很小的有限集合，lru_cache 之后每次组装只剩 prefix + state + suffix 一次拼接
+@functools.lru_cache(maxsize=32)
+def _build_skeleton(is_admin, hide_export, readonly, enable_sync):
+    # 根据角色隐藏导出按钮；CSS 放到 </head> 前（注入点在模块顶部已预计算）
+    hide_export_css = _HIDE_EXPORT_CSS if (hide_export or not is_admin) else ""
+    readonly_css = _READONLY_CSS if readonly else ""
+    css_inject = hide_export_css + "\n" + readonly_css + "\n"
+
+    # 把覆盖逻辑插到 </body> 前（确保脚本在文档内，且执行顺序可控）
+    js_inject = _BASE_JS
+    if enable_sync and (not readonly):
+        js_inject = js_inject + _SYNC_JS
+
+    full = f"{_HEAD_PREFIX}{css_inject}{_HEAD_SUFFIX}{js_inject}{_BODY_SUFFIX}"
+    prefix, _, suffix = full.partition("__STATE_JSON__")
+    return prefix, suffix
+
+
+# cache_data：同一份 state 渲染第二次时直接命中缓存，连 prefix+state+suffix 的拼接都省掉
+@st.cache_data(max_entries=64, show_spinner=False)
+def get_html_content(
+    user_state_json,
+    is_admin=False,
+    user_display_name="",
+    hide_export: bool = False,
+    readonly: bool = False,
+    enable_sync: bool = True,
+):
+    # 如果数据库里没数据，使用默认初始状态
+    if not user_state_json:
+        user_state_json = _default_state_json(user_display_name)
+
+    prefix, suffix = _build_skeleton(bool(is_admin), bool(hide_export), bool(readonly), bool(enable_sync))
+    return f"{prefix}{user_state_json}{suffix}"
+
+# --- 员工端双向组件：前端直接 setComponentValue 把 state JSON 交还 Python ---
+# （替代旧的“隐藏 text_input + 模拟键盘事件”方案，省掉手动按钮和整页 Rerun）
+# 大模板 workflow.html 由组件静态目录下发（浏览器可缓存），websocket 只传轻量 state JSON。
+_frontend_dir = Path(__file__).with_name("frontend")
+_frontend_tpl = _frontend_dir / "workflow.html"
+try:
+    # 保持组件目录里的模板与源 HTML 同步（源文件更新后自动刷新副本）
+    if (not _frontend_tpl.exists()) or _frontend_tpl.stat().st_mtime < _html_path.stat().st_mtime:
+        _frontend_tpl.write_text(USER_ORIGINAL_HTML, encoding="utf-8")
+except Exception:
+    pass
+
+_workflow_component = components.declare_component("workflow", path=str(_frontend_dir))
+
+
+# --- 视图 fragment：把大 iframe 的渲染圈在局部，避免侧边栏/同步输入的交互整页重跑 ---
+@st.fragment
+def _render_employee_preview(selected_employee, state_json):
+    # state 没变时复用 session_state 里上次的整页字符串：
+    # 重发同一个对象 → 前端 delta 对比无变化 → iframe 不会重新挂载
+    key = ("rendered_preview", selected_employee)
+    prev = st.session_state.get(key)
+    if prev is not None and prev[0] == state_json:
+        html = prev[1]
+    else:
+        html = get_html_content(
+            state_json,
+            is_admin=True,
+            user_display_name=selected_employee,
+            hide_export=True,
+            readonly=True,
+            enable_sync=False,
+        )
+        st.session_state[key] = (state_json, html)
+    components.html(html, height=950, scrolling=True)
+
+
+@st.fragment
+def _employee_workspace():
+    current_state = load_state(st.session_state.username, _state_version(st.session_state.username))
+
+    # 员工端追求“纯 HTML”：隐藏 header（注意不要在未登录/管理员时隐藏，否则手机端无法打开侧边栏）
+    st.markdown(
+        """
+<style>
+header { display: none !important; }
+</style>
+""",
+        unsafe_allow_html=True,
+    )
+
+    # 1. 渲染：只把 state JSON 交给组件；大模板由组件宿主从静态目录 fetch
+    #    （CSS/桥接脚本的注入也在前端完成，见 frontend/index.html 与 frontend/bridge.js）
+    state_payload = current_state or _default_state_json(st.session_state.username)
+
+    # 2. 接收来自前端的自动同步数据：组件返回值就是最新的 state JSON
+    new_state = _workflow_component(state_json=state_payload, height=950, key="workflow_sync", default=None)
+    if new_state and new_state != current_state:
+        try:
+            _json_loads(new_state)  # 校验是合法 JSON 再入库
+            _queue_state_write(st.session_state.username, new_state)
+        except Exception:
+            pass
+
 
 # --- 页面配置 ---
 st.set_page_config(page_title="工作流工作记录分析系统", layout="wide", initial_sidebar_state="expanded")
@@ -563,10 +861,8 @@ with st.sidebar:
                     st.rerun()
 
                 # 2. 检查数据库用户
-                conn = get_db_connection()
-                res = conn.execute("SELECT role FROM users WHERE username=? AND password=?", (l_user, l_pwd)).fetchone()
-                conn.close()
-                if res:
+                res = reader().execute(SQL_LOGIN, (l_user,)).fetchone()
+                if res and res[1] is not None and hmac.compare_digest(bytes(res[1]), _hash_pwd(l_pwd)):
                     st.session_state.logged_in = True
                     st.session_state.username = l_user
                     st.session_state.role = res[0]
@@ -579,13 +875,16 @@ with st.sidebar:
             r_pwd = st.text_input("设置密码", type="password", key="r_pwd")
             r_role = st.selectbox("角色", ["employee", "admin"])
             if st.button("提交注册"):
-                try:
-                    conn = get_db_connection()
-                    conn.execute("INSERT INTO users VALUES (?, ?, ?)", (r_user, r_pwd, r_role))
-                    conn.commit()
-                    conn.close()
+                # ON CONFLICT DO NOTHING RETURNING：一次往返检测主键冲突，
+                # 不走插入后回滚 + Python 异常机制
+                cur = writer().execute(
+                    "INSERT INTO users(username, password, role, pwd_hash) VALUES (?, '', ?, ?) "
+                    "ON CONFLICT(username) DO NOTHING RETURNING username",
+                    (r_user, r_role, _hash_pwd(r_pwd)),
+                )
+                if cur.fetchone():
                     st.success("注册成功，请登录")
-                except:
+                else:
                     st.error("账号已存在")
     else:
         st.write(f"当前用户: **{st.session_state.username}**")
@@ -596,12 +895,11 @@ with st.sidebar:
 
 # --- 主界面逻辑 ---
 if st.session_state.logged_in:
-    conn = get_db_connection()
-    
+    conn = reader()
+
     if st.session_state.role == "admin":
         # 管理员：不显示“本人”，只看员工的一条实时状态 + 展开查看 CSV 三表（不下载）
-        all_users = pd.read_sql("SELECT username FROM users WHERE role='employee'", conn)
-        employees = all_users["username"].tolist()
+        employees = _employee_list()
 
         with st.sidebar:
             st.markdown("### 员工列表")
@@ -616,21 +914,20 @@ if st.session_state.logged_in:
                 st.rerun()
 
         if selected_employee:
-            res = conn.execute(
-                "SELECT state_json, last_updated FROM user_data WHERE username=?",
-                (selected_employee,),
-            ).fetchone()
-            state_json = res[0] if res else None
-            last_updated = res[1] if res else None
+            last_updated = _state_version(selected_employee)
+            state_json = load_state(selected_employee, last_updated)
             state = _load_state_from_db(state_json, user_display_name=selected_employee)
 
             status = _compute_admin_status(state)
             sync_hint = ""
             try:
                 if last_updated:
-                    # sqlite timestamp usually "YYYY-MM-DD HH:MM:SS.mmmmmm"
-                    dt = datetime.fromisoformat(str(last_updated))
-                    age = max(0, int((datetime.now() - dt).total_seconds()))
+                    try:
+                        ts = float(last_updated)  # 新格式：Unix 秒
+                    except (TypeError, ValueError):
+                        # 旧行：sqlite timestamp "YYYY-MM-DD HH:MM:SS.mmmmmm"
+                        ts = datetime.fromisoformat(str(last_updated)).timestamp()
+                    age = max(0, int(time.time() - ts))
                     sync_hint = f"同步：{age}s前"
                 else:
                     sync_hint = "同步：无记录"
@@ -663,159 +960,53 @@ if st.session_state.logged_in:
             )
 
             with st.expander(f"{selected_employee} - CSV 三表实时展示", expanded=True):
-                tables = _build_admin_tables(state, selected_employee)
+                # 轮询但没有新保存时，复用 session_state 里上一轮的同一批 DataFrame 对象：
+                # 发往前端的 delta 与上一轮完全一致，表格不会重挂载，序列化也走协议层缓存
+                render_key = (selected_employee, last_updated)
+                if st.session_state.get("last_admin_render_key") != render_key:
+                    st.session_state["last_admin_render_key"] = render_key
+                    st.session_state["last_admin_tables"] = _cached_admin_tables(
+                        selected_employee, last_updated, state_json
+                    )
+                tables = st.session_state["last_admin_tables"]
                 st.markdown("#### 表格一：任务汇总")
-                st.dataframe(tables["tasks"], use_container_width=True, hide_index=True)
+                st.empty().dataframe(tables["tasks"], use_container_width=True, hide_index=True)
                 st.markdown("#### 表格二：工时统计")
-                st.dataframe(tables["attendance"], use_container_width=True, hide_index=True)
+                st.empty().dataframe(tables["attendance"], use_container_width=True, hide_index=True)
                 st.markdown("#### 表格三：全流水详细审计日志")
-                st.dataframe(tables["logs"], use_container_width=True, hide_index=True)
+                st.empty().dataframe(tables["logs"], use_container_width=True, hide_index=True)
 
             # 员工界面投射（只读，不显示开始/完成/打卡/会议/休息/新增/导出按钮）
-            with st.expander(f"{selected_employee} - 员工界面预览（只读）", expanded=False):
-                components.html(
-                    get_html_content(
-                        state_json,
-                        is_admin=True,
-                        user_display_name=selected_employee,
-                        hide_export=True,
-                        readonly=True,
-                        enable_sync=False,
-                    ),
-                    height=950,
-                    scrolling=True,
-                )
+            # toggle 而不是 expander：折叠的 expander 仍会执行并下发整页 HTML，
+            # 关着的时候干脆不构建、不传输
+            show_preview = st.toggle(
+                f"显示员工界面预览（只读） - {selected_employee}",
+                value=False,
+                key=f"prev_{selected_employee}",
+            )
+            if show_preview:
+                _render_employee_preview(selected_employee, state_json)
 
             # 自动刷新（可选）：默认关闭，避免页面不断重跑导致“空白感”
             if refresh_sec and refresh_sec > 0:
                 st.caption(f"自动刷新已开启：{int(refresh_sec)} 秒（建议用“手动刷新”更稳定）")
 
-    else:
-        # 员工功能
-        res = conn.execute("SELECT state_json FROM user_data WHERE username=?", (st.session_state.username,)).fetchone()
-        current_state = res[0] if res else None
-        
-        # 员工端追求“纯 HTML”：隐藏 header（注意不要在未登录/管理员时隐藏，否则手机端无法打开侧边栏）
-        st.markdown(
-            """
-<style>
-header { display: none !important; }
-</style>
-""",
-            unsafe_allow_html=True,
-        )
-
-        # 1. 接收来自前端的自动同步数据
-        # 我们创建一个隐藏的输入框，前端 JS 会把 state JSON 写入这里并触发 Rerun
-        # key 必须固定，否则重绘会丢失焦点
-        sync_data = st.text_input("sync_hidden_input", key="sync_input", label_visibility="visible") 
-        # label_visibility="visible" 为了调试，看能不能看到输入框，如果不希望看到，后续改回 collapsed
-        # 同时利用 CSS 把它藏起来，但保持 DOM 结构完整
-        st.markdown("""<style>div[data-testid="stTextInput"] input[aria-label="sync_hidden_input"] { opacity: 0.01; height: 1px; }</style>""", unsafe_allow_html=True)
-
-        
-        if sync_data:
-            try:
-                # 只有当数据真的变化且有效时才写入
-                # 为了避免死循环，我们可以对比一下最后更新时间或内容hash，这里简化处理
-                parsed = json.loads(sync_data)
-                
-                # 写入 DB
-                conn.execute(
-                    "INSERT OR REPLACE INTO user_data VALUES (?, ?, ?)",
-                    (st.session_state.username, sync_data, datetime.now()),
-                )
-                conn.commit()
-                
-                # 更新当前的 current_state，确保 Python 渲染的 HTML 也是最新的
-                current_state = sync_data
-                
-                # 清空输入框以防下一次 Rerun 重复处理 (Streamlit 机制限制，可能需要 Session State 配合)
-                # 但由于 HTML 是根据 current_state 渲染的，所以即便清空也没关系，前端会维持状态
-            except Exception:
-                pass
-
-        # 2. 渲染 HTML
-        # 我们注入一段 JS：重写 saveState 函数，使其不仅保存到 LocalStorage，
-        # 还把 state JSON 填入 Streamlit 的隐藏输入框并触发 Input 事件
-        
-        # 查找 Streamlit input 的 JS 逻辑（通过 aria-label 或结构查找）
-        # 注意：Streamlit 的 DOM 结构可能会变，这里使用一种较通用的查找方式
-        
-        auto_sync_js = """
-        <script>
-            function findStreamlitInput() {
-                // 更健壮的查找：查找 key="sync_input" 生成的 widget
-                // Streamlit 生成的 input 通常有 aria-label
-                const inputs = document.querySelectorAll('input');
-                for (let input of inputs) {
-                    if (input.getAttribute("aria-label") === "sync_hidden_input") {
-                        return input;
-                    }
-                }
-                return null;
-            }
-
-            function triggerStreamlitSync() {
-                const input = findStreamlitInput();
-                if (!input) {
-                    console.log("Sync failed: input not found");
-                    return;
-                }
-
-                const newState = JSON.stringify(state);
-                
-                // 强制触发更新，哪怕内容一样（为了心跳）
-                // 模拟 React 的输入事件
-                const nativeInputValueSetter = Object.getOwnPropertyDescriptor(window.HTMLInputElement.prototype, "value").set;
-                nativeInputValueSetter.call(input, newState);
-                
-                const event = new Event('input', { bubbles: true });
-                input.dispatchEvent(event);
-                
-                // Streamlit 2024+ 版本的 Text Input 需要更激进的触发方式
-                // 尝试模拟 Enter 键
-                const enterEvent = new KeyboardEvent('keydown', {
-                    bubbles: true, cancelable: true, keyCode: 13, key: 'Enter', code: 'Enter'
-                });
-                input.dispatchEvent(enterEvent);
-                
-                // 再次尝试 blur，有些版本依赖失焦提交
-                input.dispatchEvent(new Event('blur', { bubbles: true }));
-                
-                console.log("Sync triggered to Python");
-            }
-
-            // 覆盖 saveState
-            const __oldSaveState = saveState;
-            saveState = function() {
-                __oldSaveState(); // 原有的 LocalStorage 逻辑
-                triggerStreamlitSync(); // 触发 Streamlit 同步
-            }
-            
-            // 轮询：每10秒强制同步一次
-            setInterval(() => {
-                triggerStreamlitSync();
-            }, 10000);
-            
-            // 页面加载完成后尝试一次同步
-            setTimeout(triggerStreamlitSync, 2000);
-        </script>
-        """
-        
-        final_html = get_html_content(current_state, is_admin=False, user_display_name=st.session_state.username)
-        final_html = _inject_before_tag(final_html, "</body>", auto_sync_js)
+        # 全员数据概览：只取摘要列（state_json 可能有几 MB/人，整表拉取+渲染会卡在序列化上）
+        with st.expander("全员数据概览", expanded=False):
+            rows = conn.execute(
+                "SELECT username, last_updated, length(state_json) FROM user_data"
+            ).fetchall()
+            overview = pd.DataFrame(rows, columns=["账号", "最近同步", "字节数"])
+            st.dataframe(overview, use_container_width=True, hide_index=True)
+            detail_user = st.selectbox("查看某个账号的原始 state_json", ["(不查看)"] + overview["账号"].tolist())
+            if detail_user != "(不查看)":
+                # 仅在选中时才拉取大字段
+                row = conn.execute("SELECT state_json FROM user_data WHERE username=?", (detail_user,)).fetchone()
+                st.json(_safe_json_loads(decompress_state(row[0]) if row else None))
 
-        components.html(
-            final_html,
-            height=950,
-            scrolling=True,
-        )
-
-        # 移除之前的手动同步区
-        # with st.expander("☁️ 数据同步中心", expanded=True): ...
-
-    conn.close()
+    else:
+        # 员工功能（整体包在 fragment 里：同步输入触发的重跑只重跑这一块，不重建整页）
+        _employee_workspace()
 else:
     # 主界面不展示 Streamlit 提示文案，保持纯 HTML 画面
     st.empty()
@@ -1,90 +1,252 @@
+"""asyncio 版同步服务端。
+
+ThreadingHTTPServer 每个在途请求占一条 OS 线程，团队客户端齐刷刷自动同步时
+线程churn + GIL 上的 JSON 解析争抢是大头。这里换成单事件循环：
+asyncio.start_server 收请求（HTTP/1.1 keep-alive，解析只认 POST /sync 和
+OPTIONS 预检），校验后把写操作丢进 asyncio.Queue，由唯一的 writer 任务批量
+落库——单写入方天然没有 WAL 写锁争抢，一批一次 BEGIN/COMMIT 把 fsync 摊薄。
+SQLite 调用通过 asyncio.to_thread 下沉，不阻塞事件循环。
+"""
+
 import argparse
+import asyncio
+import hashlib
 import json
 import sqlite3
-from datetime import datetime
-from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import time
+
+from storage import compress_state
+
+# JSON 编解码走 C 实现：orjson > ujson > 标准库，装了哪个用哪个，不加硬依赖。
+# orjson 直接吃 bytes，还省掉 body.decode() 的一次拷贝。
+try:
+    import orjson as _oj
+
+    _loads = _oj.loads
+
+    def _dumps(obj) -> str:
+        return _oj.dumps(obj).decode("utf-8")
+except ImportError:
+    try:
+        import ujson as _uj
+
+        _loads = _uj.loads
 
+        def _dumps(obj) -> str:
+            return _uj.dumps(obj, ensure_ascii=False)
+    except ImportError:
+        _loads = json.loads
 
-def _set_cors_headers(handler: BaseHTTPRequestHandler) -> None:
-    # 兼容 iframe / 不同端口：尽量回显 Origin，避免部分浏览器对 null/* 的限制
-    origin = handler.headers.get("Origin") or "*"
-    handler.send_header("Access-Control-Allow-Origin", origin)
-    handler.send_header("Access-Control-Allow-Methods", "POST, OPTIONS")
-    handler.send_header("Access-Control-Allow-Headers", "Content-Type")
-    handler.send_header("Access-Control-Max-Age", "600")
-    handler.send_header("Cache-Control", "no-store")
+        def _dumps(obj) -> str:
+            return json.dumps(obj, ensure_ascii=False)
 
 
-class SyncHandler(BaseHTTPRequestHandler):
-    db_path: str = "workflow_system.db"
+def _build_response(status: str, body: bytes) -> bytes:
+    # 状态行 + 头 + 体一次拼好，单笔 write 出去。
+    # POST 走无凭证 fetch，CORS 用 * 即可
+    head = (
+        f"HTTP/1.1 {status}\r\n"
+        "Access-Control-Allow-Origin: *\r\n"
+        "Cache-Control: no-store\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "\r\n"
+    )
+    return head.encode("latin-1") + body
 
-    def do_OPTIONS(self):
-        self.send_response(204)
-        _set_cors_headers(self)
-        self.end_headers()
 
-    def do_POST(self):
-        if self.path.split("?", 1)[0] != "/sync":
-            self.send_response(404)
-            _set_cors_headers(self)
-            self.end_headers()
-            self.wfile.write(b"not found")
-            return
+_RESP_OK = _build_response("200 OK", b"ok")
+_RESP_OK_UNCHANGED = _build_response("200 OK", b"ok unchanged")
+_RESP_NOT_FOUND = _build_response("404 Not Found", b"not found")
+_RESP_BAD_JSON = _build_response("400 Bad Request", b"invalid json")
+_RESP_NO_USER = _build_response("400 Bad Request", b"missing username")
+_RESP_NO_STATE = _build_response("400 Bad Request", b"missing state")
+_RESP_PREFLIGHT = (
+    "HTTP/1.1 204 No Content\r\n"
+    "Access-Control-Allow-Origin: *\r\n"
+    "Access-Control-Allow-Methods: POST, OPTIONS\r\n"
+    "Access-Control-Allow-Headers: Content-Type\r\n"
+    "Access-Control-Max-Age: 600\r\n"
+    "Content-Length: 0\r\n"
+    "\r\n"
+).encode("latin-1")
 
-        length = int(self.headers.get("Content-Length", "0") or "0")
-        body = self.rfile.read(length) if length > 0 else b"{}"
+# writer 一次批量最多吃掉的队列条目数
+_BATCH_MAX = 100
 
+
+class SyncServer:
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.queue: asyncio.Queue = asyncio.Queue()
+        # 每用户上次落库 state 的摘要：整棵 state 没变的 POST 直接回包跳过入队。
+        # 只有事件循环读写，无需加锁
+        self._last_state_hash: dict = {}
+
+    # ---- 写入端：唯一的 writer 任务 ----
+
+    def _open_conn(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: list) -> list:
+        # 一批一笔事务：重传的旧事件被 INSERT OR IGNORE 吸收，
+        # 同一用户一批里的多次全量覆盖以最后一条为准（REPLACE 语义）
+        conn.execute("BEGIN")
+        written = []
         try:
-            payload = json.loads(body.decode("utf-8"))
+            for kind, username, payload, digest in batch:
+                if kind == "events":
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO events(username, seq, ts, kind, payload)"
+                        " VALUES (?, ?, ?, ?, ?)",
+                        payload,
+                    )
+                else:
+                    # last_updated 存 Unix 秒（与 streamlit_app 的 schema 一致）
+                    conn.execute(
+                        "INSERT OR REPLACE INTO user_data VALUES (?, ?, ?)",
+                        (username, compress_state(payload), int(time.time())),
+                    )
+                    written.append((username, digest))
+            conn.commit()
         except Exception:
-            self.send_response(400)
-            _set_cors_headers(self)
-            self.end_headers()
-            self.wfile.write(b"invalid json")
-            return
+            # 连接是长活且唯一的：不回滚的话 BEGIN 会一直挂着，
+            # 之后每一批都死在 "cannot start a transaction within a transaction"
+            try:
+                conn.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+            raise
+        return written
+
+    async def writer(self) -> None:
+        conn = self._open_conn()
+        try:
+            while True:
+                batch = [await self.queue.get()]
+                while len(batch) < _BATCH_MAX:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except asyncio.QueueEmpty:
+                        break
+                try:
+                    written = await asyncio.to_thread(self._write_batch, conn, batch)
+                except Exception as e:
+                    # 写失败不更新摘要：同样的 state 下次还会重试落库
+                    print(f"[sync_server] write batch failed: {e}")
+                else:
+                    for username, digest in written:
+                        self._last_state_hash[username] = digest
+                finally:
+                    for _ in batch:
+                        self.queue.task_done()
+        finally:
+            conn.close()
+
+    # ---- 读取端：HTTP 解析与应答 ----
+
+    def _handle_sync(self, body: bytes) -> bytes:
+        try:
+            payload = _loads(body)
+        except Exception:
+            return _RESP_BAD_JSON
 
         username = payload.get("username")
         state = payload.get("state")
+        events = payload.get("events")
 
         if not username or not isinstance(username, str):
-            self.send_response(400)
-            _set_cors_headers(self)
-            self.end_headers()
-            self.wfile.write(b"missing username")
-            return
+            return _RESP_NO_USER
+        if not isinstance(state, dict) and not isinstance(events, list):
+            return _RESP_NO_STATE
 
-        if not isinstance(state, dict):
-            self.send_response(400)
-            _set_cors_headers(self)
-            self.end_headers()
-            self.wfile.write(b"missing state")
-            return
+        # 增量路径：客户端只带上次确认后的新事件，按 (username, seq) 幂等入库。
+        # seq 可能不是数字（畸形客户端）：int() 抛出来会没有任何 HTTP 应答就断连，
+        # 这里统一折算成 400
+        if isinstance(events, list) and events:
+            try:
+                rows = [
+                    (
+                        username,
+                        int(e.get("seq")),
+                        str(e.get("ts") or ""),
+                        str(e.get("kind") or ""),
+                        _dumps(e.get("payload")),
+                    )
+                    for e in events
+                    if isinstance(e, dict) and e.get("seq") is not None
+                ]
+            except (TypeError, ValueError):
+                return _RESP_BAD_JSON
+            if rows:
+                self.queue.put_nowait(("events", username, rows, None))
 
-        state_json = json.dumps(state, ensure_ascii=False)
+        # 全量路径（兜底 / 首次同步）：整块 state 没变就不入队
+        if isinstance(state, dict):
+            state_json = _dumps(state)
+            digest = hashlib.blake2b(state_json.encode("utf-8"), digest_size=16).digest()
+            if self._last_state_hash.get(username) == digest:
+                return _RESP_OK_UNCHANGED
+            self.queue.put_nowait(("state", username, state_json, digest))
 
+        return _RESP_OK
+
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
         try:
-            conn = sqlite3.connect(self.db_path)
-            conn.execute(
-                "INSERT OR REPLACE INTO user_data VALUES (?, ?, ?)",
-                (username, state_json, datetime.now()),
-            )
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            self.send_response(500)
-            _set_cors_headers(self)
-            self.end_headers()
-            self.wfile.write(str(e).encode("utf-8"))
-            return
+            while True:
+                request_line = await reader.readline()
+                if not request_line or request_line in (b"\r\n", b"\n"):
+                    break
+                parts = request_line.split()
+                if len(parts) < 2:
+                    break
+                method, path = parts[0], parts[1]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.partition(b":")
+                    headers[key.strip().lower()] = value.strip()
+                # 先把请求体读干净再应答，避免残留字节毒化 keep-alive 连接
+                length = int(headers.get(b"content-length", b"0") or b"0")
+                body = await reader.readexactly(length) if length > 0 else b"{}"
 
-        self.send_response(200)
-        _set_cors_headers(self)
-        self.end_headers()
-        self.wfile.write(b"ok")
+                if method == b"OPTIONS":
+                    writer.write(_RESP_PREFLIGHT)
+                elif method == b"POST" and path.split(b"?", 1)[0] == b"/sync":
+                    writer.write(self._handle_sync(body))
+                else:
+                    writer.write(_RESP_NOT_FOUND)
+                await writer.drain()
+                if headers.get(b"connection", b"").lower() == b"close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionResetError, BrokenPipeError):
+                pass
 
-    def log_message(self, format, *args):
-        # 静默日志，避免刷屏
-        return
+
+async def serve(host: str, port: int, db_path: str) -> None:
+    sync = SyncServer(db_path)
+    writer_task = asyncio.create_task(sync.writer())
+    server = await asyncio.start_server(sync.handle_client, host, port)
+    print(f"[sync_server] listening on http://{host}:{port} (db={db_path})")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # 收尾：把队列里还没落库的批次冲完再退出
+        await sync.queue.join()
+        writer_task.cancel()
 
 
 def main():
@@ -95,13 +257,20 @@ def main():
     parser.add_argument("--db", default="workflow_system.db")
     args = parser.parse_args()
 
-    SyncHandler.db_path = args.db
-    httpd = ThreadingHTTPServer((args.host, args.port), SyncHandler)
-    print(f"[sync_server] listening on http://{args.host}:{args.port} (db={args.db})")
-    httpd.serve_forever()
+    # 事件流水表：增量同步的落点。(username, seq) 主键让重传天然幂等
+    conn = sqlite3.connect(args.db)
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS events
+           (username TEXT, seq INTEGER, ts TEXT, kind TEXT, payload TEXT,
+            PRIMARY KEY (username, seq))"""
+    )
+    conn.commit()
+    conn.close()
+    try:
+        asyncio.run(serve(args.host, args.port, args.db))
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == "__main__":
     main()
-
-
@@ -1,20 +1,38 @@
 
-import streamlit.components.v1 as components
+import functools
 import json
 
+import streamlit.components.v1 as components
+
+
+@functools.lru_cache(maxsize=64)
+def _js_html(js_code):
+    # 代码经 json.dumps 注入成 JS 字符串字面量，引号/反斜杠不会再被 f-string
+    # 二次转义；同一段代码生成的 HTML 字节级一致（st_javascript 依赖这一点）
+    payload = json.dumps(js_code)
+    return f"""
+        <script>
+            if (!window.__st_js_done) {{
+                window.__st_js_done = true;
+                var result = eval({payload});
+                window.parent.postMessage({{
+                    isStreamlitMessage: true,
+                    type: "streamlit:setComponentValue",
+                    value: result
+                }}, "*");
+            }}
+        </script>
+    """
+
+
 def st_javascript(js_code):
     """
     Execute JS code and return the result.
     This is a minimal implementation of streamlit-javascript to avoid extra dependencies.
-    """
-    components.html(f"""
-        <script>
-            var result = eval("{js_code}");
-            window.parent.postMessage({{
-                isStreamlitMessage: true,
-                type: "streamlit:setComponentValue",
-                value: result
-            }}, "*");
-        </script>
-    """, height=0, width=0)
 
+    同一段代码的 HTML 做了记忆化：重跑时传给前端的 markup 完全一致，
+    Streamlit 的增量渲染会原地保留 iframe，不再每次重跑都从头引导一个新的
+    JS 上下文（解析 + DOMContentLoaded + postMessage 握手）。
+    window.__st_js_done 守卫保证脚本在该 iframe 里只执行一次。
+    """
+    components.html(_js_html(js_code), height=0, width=0)